@@ -1,130 +1,220 @@
-import math
+import gc
 import mmap
 import multiprocessing
 import os
+import sys
+import threading
+from contextlib import nullcontext
+from fractions import Fraction
+from concurrent.futures import ThreadPoolExecutor
 
-def round_inf(x):
-    """Round to one decimal place using ceiling (round to infinity)."""
-    return math.ceil(x * 10) / 10
+MIN_CHUNK_SIZE = 16 * 1024 * 1024  # 16MB, well past the default readahead window
+
+# Every one-decimal score from -99.9 to 99.9, mapped to integer tenths
+TENTHS = {f"{t / 10:.1f}".encode(): t for t in range(-999, 1000)}
+TENTHS[b"-0.0"] = 0
+
+# Lock shards for threads flushing into the shared table (power of two)
+LOCK_SHARDS = 64
+NO_LOCK = nullcontext()
+
+# Most iovecs a single writev accepts on Linux
+IOV_MAX = 1024
+
+def round_inf(tenths, count=1):
+    """Divide tenths (int or Fraction) by count, rounding up (round to infinity) to one decimal."""
+    return -(-tenths // count) / 10
+
+def parse_segment(buf, start, end):
+    """Split raw bytes buf[start:end] into parallel lists of names and scores."""
+    chunk = buf[start:end]
+    num_semis = chunk.count(b';')
+    fields = chunk.replace(b'\n', b';').split(b';')
+    num_newlines = len(fields) - 1 - num_semis
+    # Heuristic: one ';' per line, else parse per line (errors that cancel out slip through)
+    if num_semis != num_newlines + (not chunk.endswith(b'\n')):
+        names = []
+        scores = []
+        for line in chunk.splitlines():
+            city, sep, score_str = line.partition(b';')
+            if sep:
+                names.append(city)
+                scores.append(score_str)
+        return names, scores
+    
+    if len(fields) & 1:
+        # Drop the empty tail after the final newline
+        fields.pop()
+    return fields[0::2], fields[1::2]
 
 def process_chunk(args):
-    """Process a chunk of the file and return aggregated results."""
+    """Process a chunk of the file and return (ids, mins, maxs, sums, counts) in tenths."""
     filename, start_offset, end_offset = args
-    data = {}
-    with open(filename, "rb") as f:
-        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    ids = {}
+    mins = []
+    maxs = []
+    sums = []
+    counts = []
+    # Each worker maps the file itself
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    finally:
+        os.close(fd)
+    try:
         size = len(mm)
         
-        # Move start_offset to next newline if not at file beginning
+        # Move start_offset past the next newline if not at file beginning
         if start_offset != 0:
-            while start_offset < size and mm[start_offset] != ord('\n'):
-                start_offset += 1
-            start_offset += 1
+            nl = mm.find(b'\n', start_offset)
+            start_offset = nl + 1 if nl >= 0 else size
         
         # Extend end_offset to cover the full line
-        end = end_offset
-        while end < size and mm[end] != ord('\n'):
-            end += 1
-        if end < size:
-            end += 1
+        nl = mm.find(b'\n', end_offset)
+        end = nl + 1 if nl >= 0 else size
         
-        chunk = mm[start_offset:end]
+        names, scores = parse_segment(mm, start_offset, end)
+    finally:
         mm.close()
     
-    # Process each line using splitlines() for speed
-    for line in chunk.splitlines():
-        if not line:
-            continue
-        
-        # Use partition to separate the two fields
-        city, sep, score_str = line.partition(b';')
-        if sep != b';':
-            continue
+    # Aggregate on the raw name bytes; names are decoded only for output
+    ids_get = ids.get
+    tenths = TENTHS.get
+    for city, score_str in zip(names, scores):
+        score = tenths(score_str)
+        if score is None:
+            # Off-table formats ("5", "12.34", ...): exact tenths as a Fraction
+            try:
+                score = Fraction(score_str.decode()) * 10
+            except ValueError:
+                continue
         
-        try:
-            score = float(score_str)
-        except ValueError:
+        i = ids_get(city)
+        if i is None:
+            ids[city] = len(counts)
+            mins.append(score)
+            maxs.append(score)
+            sums.append(score)
+            counts.append(1)
             continue
-        
-        if city in data:
-            stats = data[city]
-            if score < stats[0]:
-                stats[0] = score 
-            if score > stats[1]:
-                stats[1] = score 
-            stats[2] += score
-            stats[3] += 1
-        else:
-            data[city] = [score, score, score, 1]
+        if score < mins[i]:
+            mins[i] = score
+        if score > maxs[i]:
+            maxs[i] = score
+        sums[i] += score
+        counts[i] += 1
     
-    return data
+    return ids, mins, maxs, sums, counts
 
-def merge_data(data_list):
-    """Merge results from all chunks into a single dictionary."""
-    final = {}
-    for data in data_list:
-        for city, stats in data.items():
-            if city in final:
-                final_stats = final[city]
-                if stats[0] < final_stats[0]:
-                    final_stats[0] = stats[0]
-                if stats[1] > final_stats[1]:
-                    final_stats[1] = stats[1]
-                final_stats[2] += stats[2]
-                final_stats[3] += stats[3]
-            else:
-                final[city] = stats.copy()
-    return final
+def gil_enabled():
+    """Return False on a free-threaded (nogil) interpreter."""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is None or is_gil_enabled()
+
+def usable_cpus():
+    """Return the number of CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 4
+
+def merge_chunk(table, result, locks=None, insert_lock=None):
+    """Fold one chunk's results into table, optionally under sharded locks."""
+    ids, mins, maxs, sums, counts = table
+    chunk_ids, chunk_mins, chunk_maxs, chunk_sums, chunk_counts = result
+    for city, j in chunk_ids.items():
+        lock = locks[hash(city) & (len(locks) - 1)] if locks else NO_LOCK
+        with lock:
+            i = ids.get(city)
+            if i is None:
+                with insert_lock or NO_LOCK:
+                    ids[city] = len(counts)
+                    mins.append(chunk_mins[j])
+                    maxs.append(chunk_maxs[j])
+                    sums.append(chunk_sums[j])
+                    counts.append(chunk_counts[j])
+                continue
+            if chunk_mins[j] < mins[i]:
+                mins[i] = chunk_mins[j]
+            if chunk_maxs[j] > maxs[i]:
+                maxs[i] = chunk_maxs[j]
+            sums[i] += chunk_sums[j]
+            counts[i] += chunk_counts[j]
+
+def write_lines(fd, lines):
+    """Write a list of bytes to fd with one writev call per IOV_MAX lines."""
+    for i in range(0, len(lines), IOV_MAX):
+        batch = lines[i:i + IOV_MAX]
+        if hasattr(os, "writev"):
+            written = os.writev(fd, batch)
+            rest = b"".join(batch)[written:] if written < sum(map(len, batch)) else b""
+        else:
+            rest = b"".join(batch)
+        # Finish any short write
+        while rest:
+            rest = rest[os.write(fd, rest):]
 
 def main(input_file_name="testcase.txt", output_file_name="output.txt"):
     """Main function to process the input file and write the output."""
-    # Determine file size using mmap for efficiency
-    with open(input_file_name, "rb") as f:
-        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
-        file_size = len(mm)
-        mm.close()
+    # Workers map the file themselves; only the size is needed here
+    file_size = os.path.getsize(input_file_name)
     
     if file_size == 0:  # Handle empty file case
         with open(output_file_name, "w") as f:
             f.write("")
         return
     
-    # Improved parallelism: target ~10MB chunks, cap at 4x CPU count
-    cpu_count = multiprocessing.cpu_count()
-    target_chunk_size = 10 * 1024 * 1024  # 10MB
-    num_procs = max(1, min(cpu_count * 4, file_size // target_chunk_size))
-    chunk_size = file_size // num_procs
-    chunks = [(i * chunk_size, (i + 1) * chunk_size if i < num_procs - 1 else file_size)
-              for i in range(num_procs)]
+    # Equal chunks, about 4 per CPU, in whole waves of cpu_count chunks
+    cpu_count = usable_cpus()
+    chunk_size = max(MIN_CHUNK_SIZE, file_size // (cpu_count * 4))
+    num_chunks = max(1, file_size // chunk_size)
+    if num_chunks >= cpu_count:
+        num_chunks -= num_chunks % cpu_count
+    bounds = [i * file_size // num_chunks for i in range(num_chunks)] + [file_size]
+    chunks = list(zip(bounds, bounds[1:]))
+    # One worker per usable CPU at most; extra chunks queue behind them
+    num_procs = min(len(chunks), cpu_count)
     tasks = [(input_file_name, start, end) for start, end in chunks]
     
-    # Process chunks in parallel with optimized distribution
-    with multiprocessing.Pool(processes=num_procs) as pool:
-        results = pool.map(process_chunk, tasks, chunksize=1)
+    # Fold each chunk into one table: in-process, on nogil threads, or via a process pool
+    table = ids, mins, maxs, sums, counts = {}, [], [], [], []
+    # The parse creates no reference cycles, so run it without the cyclic GC
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        if num_procs == 1:
+            for task in tasks:
+                merge_chunk(table, process_chunk(task))
+        elif not gil_enabled():
+            locks = [threading.Lock() for _ in range(LOCK_SHARDS)]
+            insert_lock = threading.Lock()
+            
+            def process_and_flush(task):
+                merge_chunk(table, process_chunk(task), locks, insert_lock)
+            
+            with ThreadPoolExecutor(max_workers=num_procs) as executor:
+                for _ in executor.map(process_and_flush, tasks):
+                    pass
+        else:
+            with multiprocessing.Pool(processes=num_procs, initializer=gc.disable) as pool:
+                for result in pool.imap_unordered(process_chunk, tasks, chunksize=1):
+                    merge_chunk(table, result)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
     
-    # Merge results from all chunks
-    final_data = merge_data(results)
+    # UTF-8 bytes sort in the same order as the decoded names
+    lines = []
+    for city in sorted(ids):
+        i = ids[city]
+        avg = round_inf(sums[i], counts[i])
+        lines.append(b"%s=%.1f/%.1f/%.1f\n" % (city, round_inf(mins[i]), avg, round_inf(maxs[i])))
     
-    # Faster writing with buffering
+    # Write all lines with writev instead of joining them in Python
     out_fd = os.open(output_file_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
-    buffer = bytearray()
-    buffer_size = 64 * 1024  # 64KB buffer for efficient writes
-    
-    for city in sorted(final_data.keys(), key=lambda c: c.decode()):
-        mn, mx, total, count = final_data[city]
-        avg = round_inf(total / count)
-        line = f"{city.decode()}={round_inf(mn):.1f}/{avg:.1f}/{round_inf(mx):.1f}\n".encode()
-        buffer.extend(line)
-        
-        if len(buffer) >= buffer_size:
-            os.write(out_fd, buffer)
-            buffer.clear()
-    
-    # Write any remaining data
-    if buffer:
-        os.write(out_fd, buffer)
-    
-    os.close(out_fd)
+    try:
+        write_lines(out_fd, lines)
+    finally:
+        os.close(out_fd)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file